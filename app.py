@@ -1,67 +1,92 @@
 import streamlit as st
-import replicate
 import os
-from dotenv import load_dotenv
-from PIL import Image
-import requests
-from io import BytesIO
-import base64
-import tempfile
-import datetime
 
-# Load environment variables from .env file for local development
-load_dotenv()
+from kling_core import (
+    HISTORY_PAGE_SIZE,
+    POLL_INTERVAL,
+    SAVE_DIR,
+    USE_OBJECT_STORAGE,
+    css_html,
+    list_videos,
+    make_preview,
+    poll_jobs,
+    presigned_url,
+    submit_predictions,
+    uploaded_to_data_url,
+    video_bytes,
+    video_source,
+    wait_for_jobs,
+)
 
-# Try to get the token from either Streamlit secrets or environment variables
-replicate_api_token = os.getenv('REPLICATE_API_TOKEN') or st.secrets.get('REPLICATE_API_TOKEN')
+# Resolve the token once per session rather than on every rerun
+if "replicate_api_token" not in st.session_state:
+    # Try to get the token from either Streamlit secrets or environment variables
+    replicate_api_token = os.getenv('REPLICATE_API_TOKEN') or st.secrets.get('REPLICATE_API_TOKEN')
+    
+    if not replicate_api_token:
+        raise ValueError("No REPLICATE_API_TOKEN found in environment")
+    
+    st.session_state.replicate_api_token = replicate_api_token
 
-if not replicate_api_token:
-    raise ValueError("No REPLICATE_API_TOKEN found in environment")
-
-os.environ['REPLICATE_API_TOKEN'] = replicate_api_token
-
-# Create a directory for saving videos if it doesn't exist
-if os.getenv("STREAMLIT_SHARING"):
-    # Use temporary directory for cloud deployment
-    SAVE_DIR = tempfile.mkdtemp()
-else:
-    # Local development
-    SAVE_DIR = "generated_videos"
-    os.makedirs(SAVE_DIR, exist_ok=True)
-
-def load_image(image_url):
-    try:
-        response = requests.get(image_url)
-        img = Image.open(BytesIO(response.content))
-        return img
-    except Exception as e:
-        st.error(f"Error loading image: {e}")
-        return None
-
-def image_to_base64(image):
-    buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
-
-def save_video(video_url):
-    try:
-        # Download the video
-        response = requests.get(video_url)
-        if response.status_code == 200:
-            # Generate unique filename with timestamp
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"kling_video_{timestamp}.mp4"
-            filepath = os.path.join(SAVE_DIR, filename)
+def render_job(job):
+    params = job["params"]
+    if job.get("error"):
+        st.error(f"🚫 An error occurred: {job['error']}")
+        return
+    
+    saved_path = job.get("saved_path")
+    if not saved_path:
+        if job.get("output") and "saved_path" not in job:
+            st.write("Output:", job["output"])
+        return
+    
+    # Jobs from this batch hold their own bytes in memory mode, independent of the shared store
+    source = job.get("video_data") or video_source(saved_path)
+    if source is None:
+        st.warning("⌛ This video has expired from memory; generate it again to view it")
+        return
+    
+    # Create a container for the result
+    result_container = st.container()
+    
+    with result_container:
+        st.success("🎉 Your video has been generated successfully!")
+        
+        # Create columns for preview and details
+        preview_col, details_col = st.columns([3, 1])
+        
+        with preview_col:
+            st.subheader("📺 Preview")
+            st.video(source)
+        
+        with details_col:
+            st.subheader("📊 Details")
+            st.markdown(f"**Duration:** {params['duration']} seconds")
+            st.markdown(f"**Aspect Ratio:** {params['aspect_ratio']}")
+            st.markdown(f"**CFG Scale:** {params['cfg_scale']}")
             
-            # Save the video
-            with open(filepath, "wb") as f:
-                f.write(response.content)
-            return filepath
-        return None
-    except Exception as e:
-        st.error(f"Error saving video: {e}")
-        return None
+            # Download button
+            if USE_OBJECT_STORAGE:
+                st.link_button(
+                    "📥 Download Video",
+                    presigned_url(saved_path, download=True),
+                    use_container_width=True
+                )
+            else:
+                st.download_button(
+                    label="📥 Download Video",
+                    data=job.get("video_data") or video_bytes(saved_path) or b"",
+                    file_name=os.path.basename(saved_path),
+                    mime="video/mp4",
+                    use_container_width=True,
+                    key=f"download_{saved_path}"
+                )
+        
+        # Show prompts used
+        st.subheader("🎯 Generation Parameters")
+        st.markdown(f"**Prompt:** {params['prompt']}")
+        if params['negative_prompt']:
+            st.markdown(f"**Negative Prompt:** {params['negative_prompt']}")
 
 def main():
     # Set page config with a more modern layout
@@ -72,73 +97,8 @@ def main():
     )
 
     # Add custom CSS for better styling
-    st.markdown("""
-        <style>
-        /* Main content area */
-        .main {
-            padding: 2rem;
-        }
-        
-        /* Fix sidebar width and remove collapse functionality */
-        [data-testid="stSidebar"] {
-            min-width: 25% !important;
-            width: 25% !important;
-            height: 100vh !important;
-            position: relative !important;
-        }
-        
-        [data-testid="stSidebarContent"] {
-            height: 100vh !important;
-        }
-        
-        /* Remove sidebar navigation and collapse button */
-        [data-testid="stSidebarNavItems"] {
-            display: none !important;
-        }
-        
-        section[data-testid="stSidebarUserContent"] {
-            height: 100%;
-            padding-top: 1.5rem;
-        }
-        
-        /* Adjust main content area */
-        .main .block-container {
-            padding: 2rem 1rem 1rem 2rem !important;
-            max-width: 75% !important;
-        }
-        
-        /* Rest of your existing button and grid styles */
-        .stButton>button {
-            width: 100%;
-            border-radius: 10px;
-            height: 3em;
-            background-color: #FF4B4B;
-            color: white;
-            font-weight: bold;
-        }
-        .stButton>button:hover {
-            background-color: #FF6B6B;
-            border-color: #FF4B4B;
-        }
-        .video-grid {
-            display: grid;
-            grid-template-columns: repeat(3, 1fr);
-            gap: 1rem;
-            padding: 1rem 0;
-        }
-        .video-card {
-            border: 1px solid #ddd;
-            border-radius: 8px;
-            padding: 0.5rem;
-            background: white;
-        }
-        .video-timestamp {
-            font-size: 0.8em;
-            color: #666;
-            margin-top: 0.5rem;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Streamlit drops elements that are not redrawn, so this is emitted every rerun; it is kept compact instead
+    st.markdown(css_html(), unsafe_allow_html=True)
 
     # Main content area with better organization
     st.title("🎬 Kling AI Video Generator")
@@ -163,25 +123,26 @@ def main():
             start_image_url = None
             if uploaded_file is not None:
                 try:
-                    # Convert the uploaded file to bytes
-                    image_bytes = uploaded_file.getvalue()
-                    image = Image.open(BytesIO(image_bytes))
-                    
-                    # Convert image to RGB if it's in RGBA mode
-                    if image.mode == 'RGBA':
-                        image = image.convert('RGB')
-                    
                     # Display the preview - removed use_container_width
-                    st.image(image, caption="Preview", width=300)  # Fixed width instead
+                    st.image(make_preview(uploaded_file), caption="Preview", width=300)  # Fixed width instead
                     
-                    # Convert to base64
-                    start_image_url = image_to_base64(image)
+                    # Convert to base64 once per uploaded file
+                    start_image_url = uploaded_to_data_url(
+                        uploaded_file.file_id,
+                        uploaded_file.getvalue(),
+                        uploaded_file.type
+                    )
                 except Exception as e:
                     st.error(f"Error processing image: {str(e)}")
                     return
             
+            queue_mode = st.toggle(
+                "📋 Queue mode",
+                help="Generate one video per line of the prompt, all submitted at once"
+            )
+            
             prompt = st.text_area(
-                "✨ Prompt",
+                "✨ Prompts (one per line)" if queue_mode else "✨ Prompt",
                 placeholder="Describe what you want to generate...",
                 help="Be specific and detailed in your description"
             )
@@ -222,96 +183,93 @@ def main():
 
         with tab2:
             st.header("📚 Generation History")
-            if os.path.exists(SAVE_DIR):
-                videos = [f for f in os.listdir(SAVE_DIR) if f.endswith('.mp4')]
-                videos.sort(reverse=True)  # Sort by timestamp descending
+            # Only embed one page of videos at a time
+            limit = st.session_state.get("history_limit", HISTORY_PAGE_SIZE)
+            videos = list_videos(SAVE_DIR, limit)
+            
+            if videos:
+                st.markdown('<div class="video-grid">', unsafe_allow_html=True)
+                cols = st.columns(3)
+                for idx, (location, timestamp, size) in enumerate(videos[:limit]):
+                    col = cols[idx % 3]
+                    with col:
+                        source = video_source(location)
+                        if source is None:
+                            # Evicted by a newer save since the listing was cached
+                            continue
+                        st.video(source)
+                        st.markdown(f"<div class='video-timestamp'>{timestamp.strftime('%B %d, %Y %H:%M:%S')} · {size / (1 << 20):.1f} MB</div>",
+                                  unsafe_allow_html=True)
                 
-                if videos:
-                    st.markdown('<div class="video-grid">', unsafe_allow_html=True)
-                    cols = st.columns(3)
-                    for idx, video in enumerate(videos):
-                        col = cols[idx % 3]
-                        with col:
-                            video_path = os.path.join(SAVE_DIR, video)
-                            timestamp = datetime.datetime.strptime(
-                                video.replace('kling_video_', '').replace('.mp4', ''),
-                                "%Y%m%d_%H%M%S"
-                            )
-                            
-                            st.video(video_path)
-                            st.markdown(f"<div class='video-timestamp'>{timestamp.strftime('%B %d, %Y %H:%M:%S')}</div>",
-                                      unsafe_allow_html=True)
-                else:
-                    st.info("🎬 No previous generations found")
+                if len(videos) > limit:
+                    if st.button("⬇️ Load more", use_container_width=True):
+                        st.session_state["history_limit"] = limit + HISTORY_PAGE_SIZE
+                        st.rerun()
+            else:
+                st.info("🎬 No previous generations found")
 
     # Main content area for results
     if generate_button:
         if not uploaded_file:
             st.error("⚠️ Please upload an image to continue")
             return
-            
-        with st.status("🎥 Generating your video...") as status:
-            status.update(label="🤖 AI is processing your request...")
-            try:
-                output = replicate.run(
-                    "kwaivgi/kling-v1.6-pro",
-                    input={
-                        "prompt": prompt,
-                        "duration": duration,
-                        "cfg_scale": cfg_scale,
-                        "start_image": start_image_url,
-                        "aspect_ratio": aspect_ratio,
-                        "negative_prompt": negative_prompt
-                    }
-                )
-                
-                if output:
-                    status.update(label="✅ Generation complete!", state="complete")
-                    
-                    if isinstance(output, str) and (output.startswith('http://') or output.startswith('https://')):
-                        saved_path = save_video(output)
-                        
-                        if saved_path:
-                            # Create a container for the result
-                            result_container = st.container()
-                            
-                            with result_container:
-                                st.success("🎉 Your video has been generated successfully!")
-                                
-                                # Create columns for preview and details
-                                preview_col, details_col = st.columns([3, 1])
-                                
-                                with preview_col:
-                                    st.subheader("📺 Preview")
-                                    st.video(saved_path)
-                                
-                                with details_col:
-                                    st.subheader("📊 Details")
-                                    st.markdown(f"**Duration:** {duration} seconds")
-                                    st.markdown(f"**Aspect Ratio:** {aspect_ratio}")
-                                    st.markdown(f"**CFG Scale:** {cfg_scale}")
-                                    
-                                    # Download button
-                                    with open(saved_path, "rb") as file:
-                                        st.download_button(
-                                            label="📥 Download Video",
-                                            data=file,
-                                            file_name=os.path.basename(saved_path),
-                                            mime="video/mp4",
-                                            use_container_width=True
-                                        )
-                                
-                                # Show prompts used
-                                st.subheader("🎯 Generation Parameters")
-                                st.markdown(f"**Prompt:** {prompt}")
-                                if negative_prompt:
-                                    st.markdown(f"**Negative Prompt:** {negative_prompt}")
-                    else:
-                        st.write("Output:", output)
-                
-            except Exception as e:
-                st.error(f"🚫 An error occurred: {str(e)}")
+        
+        if queue_mode:
+            prompts = [line.strip() for line in prompt.splitlines() if line.strip()]
+        else:
+            prompts = [prompt]
+        
+        if st.session_state.get("jobs"):
+            st.warning("⏳ A generation is already running; wait for it to finish before starting another")
+        elif not prompts:
+            st.error("⚠️ Please enter at least one prompt for queue mode")
+        else:
+            # Submit every prediction up front so they queue on Replicate concurrently
+            inputs = [
+                {
+                    "prompt": job_prompt,
+                    "duration": duration,
+                    "cfg_scale": cfg_scale,
+                    "start_image": start_image_url,
+                    "aspect_ratio": aspect_ratio,
+                    "negative_prompt": negative_prompt
+                }
+                for job_prompt in prompts
+            ]
+            futures = submit_predictions(st.session_state.replicate_api_token, inputs)
+            st.session_state["jobs"] = [
+                {"future": future, "params": params}
+                for future, params in zip(futures, inputs)
+            ]
+
+    jobs = st.session_state.get("jobs")
+    if not jobs:
+        return
+    
+    with st.status(f"🎥 Generating {len(jobs)} video(s)..." if len(jobs) > 1 else "🎥 Generating your video...") as status:
+        status.update(label="🤖 AI is processing your request...")
+        poll_jobs(jobs, st.session_state.replicate_api_token)
+        
+        for job in jobs:
+            if job.get("finished"):
+                render_job(job)
+        
+        remaining = sum(1 for job in jobs if not job.get("finished"))
+        if remaining:
+            if len(jobs) > 1:
+                status.update(label=f"🤖 AI is processing your request... ({len(jobs) - remaining}/{len(jobs)} done)")
+            # Wait while the status is still open so it keeps showing as running
+            wait_for_jobs(jobs, POLL_INTERVAL)
+        else:
+            del st.session_state["jobs"]
+            if any(job.get("error") for job in jobs):
                 status.update(label="Generation failed", state="error")
+            else:
+                status.update(label="✅ Generation complete!", state="complete")
+    
+    # Rerun outside the status block; its __exit__ would otherwise flag the rerun as an error
+    if remaining:
+        st.rerun()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()